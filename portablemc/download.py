@@ -2,15 +2,17 @@
 """
 
 from http.client import HTTPConnection, HTTPSConnection, HTTPException
-from threading import Thread
+from threading import Thread, Event
+from collections import deque
 from pathlib import Path
-from queue import Queue
 import urllib.parse
 import hashlib
 import time
-import ssl
+import os
 
-from typing import Optional, Dict, List, Tuple, Union, Iterator
+from .http import get_ssl_context
+
+from typing import Optional, Dict, List, Tuple, Union, Iterator, Iterable, Deque
 
 
 class DownloadEntry:
@@ -50,31 +52,67 @@ class DownloadEntry:
 
 
 class _DownloadEntry:
-    """Internal class with already parsed URL to speed up processing and prevent 
-    unsupported URL schemes.
+    """Internal class with already parsed URL and SHA1 to speed up processing and 
+    prevent unsupported URL schemes. It is never modified while downloading, so it can
+    be downloaded again.
     """
 
-    __slots__ = "https", "host", "port", "entry"
+    __slots__ = "https", "host", "port", "url", "sha1", "entry"
 
-    def __init__(self, https: bool, host: str, port: Optional[int], entry: DownloadEntry) -> None:
+    def __init__(self, 
+        https: bool, 
+        host: str, 
+        port: Optional[int], 
+        url: str, 
+        sha1: Optional[bytes], 
+        entry: DownloadEntry
+    ) -> None:
         self.https = https
         self.host = host
         self.port = port
+        self.url = url
+        self.sha1 = sha1
         self.entry = entry
     
     @classmethod
     def from_entry(cls, entry: DownloadEntry) -> "_DownloadEntry":
 
-        # We only support HTTP/HTTPS
-        url_parsed = urllib.parse.urlparse(entry.url)
-        if url_parsed.scheme not in ("http", "https"):
-            raise ValueError(f"unsupported scheme '{url_parsed.scheme}://' from url {entry.url}")
-        
-        return cls(
-            url_parsed.scheme == "https",
-            url_parsed.netloc,
-            url_parsed.port,
-            entry)
+        # The raw digest is compared to the computed one, avoiding hex formatting.
+        sha1 = None
+        if entry.sha1 is not None:
+            try:
+                sha1 = bytes.fromhex(entry.sha1)
+            except ValueError:
+                raise ValueError(f"invalid sha1 '{entry.sha1}' from url {entry.url}")
+
+        return cls(*_parse_url(entry.url), entry.url, sha1, entry)
+
+
+def _parse_url(url: str) -> Tuple[bool, str, Optional[int]]:
+    """Internal function to parse the scheme, host and port of an URL, only HTTP and 
+    HTTPS are supported and ValueError is raised otherwise.
+    """
+
+    # Fast path for the common URLs without port nor user info, like all the ones
+    # used by Mojang, because urlparse is relatively slow for many entries.
+    if url.startswith("https://"):
+        https, host_start = True, 8
+    elif url.startswith("http://"):
+        https, host_start = False, 7
+    else:
+        https, host_start = False, 0
+    
+    if host_start:
+        host_end = url.find("/", host_start)
+        host = url[host_start:] if host_end == -1 else url[host_start:host_end]
+        if len(host) and not any(c in host for c in ":@?#[]"):
+            return https, host, None
+
+    url_parsed = urllib.parse.urlparse(url)
+    if url_parsed.scheme not in ("http", "https"):
+        raise ValueError(f"unsupported scheme '{url_parsed.scheme}://' from url {url}")
+    
+    return url_parsed.scheme == "https", url_parsed.hostname or "", url_parsed.port
 
 
 class DownloadResult:
@@ -150,6 +188,48 @@ class DownloadList:
         if entry.size is not None:
             self.size += entry.size
     
+    def count_hosts(self) -> int:
+        """Return the number of distinct hosts to download entries from, this can be
+        used to choose a relevant threads count.
+        """
+        return len({(e.https, e.host, e.port) for e in self.entries})
+
+    def add_many(self, entries: Iterable[DownloadEntry], *, verify: bool = False) -> None:
+        """Add many download entries to this list, this is equivalent to calling `add`
+        for each entry, but verification is faster when many entries share the same 
+        directories because each directory is listed once instead of checking files 
+        one by one.
+
+        :param entries: The entries to add.
+        :param verify: Set to true in order to check if the files exist and have the
+        same size has the given entries, in such case these entries are not added.
+        """
+
+        if not verify:
+            for entry in entries:
+                self.add(entry)
+            return
+
+        dirs: Dict[Path, Dict[str, os.DirEntry]] = {}
+
+        for entry in entries:
+
+            dst_dir = entry.dst.parent
+            dst_files = dirs.get(dst_dir)
+            if dst_files is None:
+                try:
+                    with os.scandir(dst_dir) as it:
+                        dst_files = {dst_file.name: dst_file for dst_file in it}
+                except OSError:
+                    dst_files = {}  # The directory doesn't exist, or isn't readable.
+                dirs[dst_dir] = dst_files
+            
+            dst_file = dst_files.get(entry.dst.name)
+            if dst_file is not None and dst_file.is_file() and (entry.size is None or entry.size == dst_file.stat().st_size):
+                continue
+
+            self.add(entry)
+    
     def download(self, threads_count: int, *,
         partial_progress: bool = False
     ) -> Iterator[Tuple[int, DownloadResult]]:
@@ -171,24 +251,34 @@ class DownloadList:
         if not entries_count or threads_count < 1:
             return
 
-        threads: List[Thread] = []
+        # Create all parent directories once before starting, many entries share the
+        # same directory (like assets), shortest paths first so parents are reused.
+        # Errors are ignored here, the entries under such directory will fail to open
+        # their file in the download thread and get a regular error result.
+        dst_dirs = {e.entry.dst.parent for e in self.entries}
+        for dst_dir in sorted(dst_dirs, key=lambda d: len(d.parts)):
+            try:
+                dst_dir.mkdir(parents=True, exist_ok=True)
+            except OSError:
+                pass
+
+        # Entries are dispatched through a deque that worker threads pop from, popleft
+        # is atomic so no lock is needed and a thread stops as soon as the deque is
+        # empty. Big files come first thanks to sorting above.
+        entries: Deque[_DownloadEntry] = deque(self.entries)
+        result_queue = _ResultQueue()
 
-        entries_queue = Queue()
-        result_queue = Queue()
+        # Ensure that the shared SSL context is created once before threads start.
+        get_ssl_context()
 
         for th_id in range(threads_count):
             th = Thread(target=_download_thread_wrapper, 
-                        args=(th_id, entries_queue, result_queue, partial_progress), 
+                        args=(th_id, entries, result_queue, partial_progress), 
                         daemon=True, 
                         name=f"Download Thread {th_id}")
             th.start()
-            threads.append(th)
         
         result_count = 0
-
-        for entry in self.entries:
-            entries_queue.put(entry)
-
         crash = None
         
         while result_count < entries_count:
@@ -203,16 +293,49 @@ class DownloadList:
             
             yield result_count, result
 
-        # Send 'threads_count' sentinels.
         # We intentionally don't join thread because it takes some time for unknown 
         # reason. And we don't care of these threads because these are daemon ones.
-        for th_id in range(threads_count):
-            entries_queue.put(None)
+        # Clearing remaining entries stop threads in case of crash.
+        entries.clear()
 
         if crash is not None:
             raise ValueError(f"unexpected crash from thread {crash.thread_id}", crash.origin)
 
 
+class _ResultQueue:
+    """Internal multi-producer single-consumer queue used by download threads to send
+    results, this is lighter than the standard `Queue` because producers only signal
+    the event (which requires a lock) when the consumer may be waiting for it, so the
+    cost is paid once for a batch of results put while the consumer is busy.
+    """
+
+    __slots__ = "results", "event"
+
+    def __init__(self) -> None:
+        self.results: Deque[object] = deque()
+        self.event = Event()
+
+    def put(self, result: object) -> None:
+        self.results.append(result)
+        if not self.event.is_set():
+            self.event.set()
+    
+    def get(self) -> object:
+        while True:
+            try:
+                return self.results.popleft()
+            except IndexError:
+                pass
+            # The event is cleared before checking the deque again, so a result put
+            # in the meantime cannot be missed: either we get it now or its producer
+            # will see the event unset and set it.
+            self.event.clear()
+            try:
+                return self.results.popleft()
+            except IndexError:
+                self.event.wait()
+
+
 class _DownloadThreadCrash:
     """Unexpected exception happening in a thread, this is the result of a bad logic
     from programmer.
@@ -225,15 +348,15 @@ class _DownloadThreadCrash:
 
 def _download_thread_wrapper(
     thread_id: int, 
-    entries_queue: Queue,
-    result_queue: Queue,
+    entries: Deque[_DownloadEntry],
+    result_queue: _ResultQueue,
     partial_progress: bool
 ) -> None:
     """Wrapper for the download thread that basically ensures that any unexpected error
     sends a signal (DownloadThreadCrash) to the master to signal the crash.
     """
     try:
-        _download_thread(thread_id, entries_queue, result_queue, partial_progress)
+        _download_thread(thread_id, entries, result_queue, partial_progress)
     except Exception as e:
         result_queue.put(_DownloadThreadCrash(thread_id, e))
     except:
@@ -244,51 +367,68 @@ def _download_thread_wrapper(
 
 def _download_thread(
     thread_id: int, 
-    entries_queue: Queue,
-    result_queue: Queue,
+    entries: Deque[_DownloadEntry],
+    result_queue: _ResultQueue,
     partial_progress: bool
 ) -> None:
     """This function is internally used for multi-threaded download.
 
-    :param entries_queue: Where entries to download are received.
+    :param entries: Where entries to download are taken from, shared between threads.
     :param result_queue: Where threads send progress update.
     """
     
-    # Cache for connections depending on host and https
-    conn_cache: Dict[Tuple[bool, str], Union[HTTPConnection, HTTPSConnection]] = {}
+    # Cache for connections depending on https, host and port
+    conn_cache: Dict[Tuple[bool, str, Optional[int]], Union[HTTPConnection, HTTPSConnection]] = {}
 
-    # Each thread has its own buffer.
-    buffer_cap = 65536
+    # Each thread has its own buffer. It's large enough to reduce the per-chunk cost of
+    # the Python loop (read, sha1 and write calls) on big files.
+    buffer_cap = 262144
     buffer_back = bytearray(buffer_cap)
     buffer = memoryview(buffer_back)
 
-    # Try to use certifi if installed, we use this context for the connections.
-    try:
-        import certifi
-        ctx = ssl.create_default_context(cafile=certifi.where())
-    except ImportError:
-        ctx = None
+    # The SSL context is shared by all threads and connections.
+    ctx = get_ssl_context()
     
     # Maximum tries count or a single entry.
     max_try_count = 3
+    # Maximum redirections followed for a single entry, apart from tries.
+    max_redirect_count = 5
 
     # For speed calculation.
     speed_update_interval = 0.25
     speed_smoothing = 0.3
-    speed_last_time = 0
+    speed_last_time = time.monotonic()
     speed_last_size = 0
     speed_current_size = 0
-    speed = 0
+    speed = 0.0
 
-    while True:
+    def update_speed() -> None:
+        """Update speed calculation if the interval has elapsed, this is only called
+        before sending a progress result, and not for each read chunk, because the
+        speed is not observable in-between.
+        """
+        nonlocal speed_last_time, speed_last_size, speed
+        now = time.monotonic()
+        speed_elapsed_time = now - speed_last_time
+        if speed_elapsed_time > speed_update_interval:
+            speed_elapsed_size = speed_current_size - speed_last_size
+            current_speed = speed_elapsed_size / speed_elapsed_time
+            speed = speed_smoothing * current_speed + (1 - speed_smoothing) * speed
+            speed_last_time = now
+            speed_last_size = speed_current_size
 
-        raw_entry: Optional[_DownloadEntry] = entries_queue.get()
+    while True:
 
-        # None is a sentinel to stop the thread, it should be consumed ONCE.
-        if raw_entry is None:
+        # The thread stops when there are no more entries to download.
+        try:
+            raw_entry = entries.popleft()
+        except IndexError:
             break
 
-        conn_key = (raw_entry.https, raw_entry.host)
+        # These are local because redirections must not modify the shared entry, that
+        # may be downloaded again later.
+        url, https, host, port = raw_entry.url, raw_entry.https, raw_entry.host, raw_entry.port
+        conn_key = (https, host, port)
         entry = raw_entry.entry
 
         # Get connection from cache or create it.
@@ -297,6 +437,7 @@ def _download_thread(
         last_error: Optional[str] = None
         last_error_origin: Optional[Exception] = None
         try_num = 0
+        redirect_num = 0
 
         while True:
 
@@ -309,17 +450,17 @@ def _download_thread(
 
             # If there is no cached connection or the connection has been reset.
             if conn is None:
-                if raw_entry.https:
-                    conn = HTTPSConnection(raw_entry.host, raw_entry.port, context=ctx)
+                if https:
+                    conn = HTTPSConnection(host, port, context=ctx)
                 else:
-                    conn = HTTPConnection(raw_entry.host, raw_entry.port)
+                    conn = HTTPConnection(host, port)
                 # Cache the connection for later use.
                 conn_cache[conn_key] = conn
             
             # This try-except block is around all potential 
             try:
                 
-                conn.request("GET", entry.url)
+                conn.request("GET", url)
                 res = conn.getresponse()
 
                 if res.status != 200:
@@ -329,27 +470,26 @@ def _download_thread(
                     while res.readinto(buffer):
                         pass
 
-                    if res.status == 301 or res.status == 302:
+                    if (res.status == 301 or res.status == 302) and redirect_num < max_redirect_count:
 
-                        redirect_url = res.headers["location"]
-                        redirect_entry = DownloadEntry(
-                            redirect_url, 
-                            entry.dst, 
-                            size=entry.size, 
-                            sha1=entry.sha1, 
-                            name=entry.name)
-                        
-                        entries_queue.put(_DownloadEntry.from_entry(redirect_entry))
-                        break  # Abort on redirect
+                        # The redirection is followed by this thread, getting the 
+                        # connection of the new host if needed. Redirections have 
+                        # their own limit and don't count as tries.
+                        redirect_num += 1
+                        try_num -= 1
+                        url = urllib.parse.urljoin(url, res.headers["location"])
+                        https, host, port = _parse_url(url)
+                        conn_key = (https, host, port)
+                        conn = conn_cache.get(conn_key)
+                        continue
 
                     # Any other non-200 code is considered not found and we retry...
                     last_error = DownloadResultError.NOT_FOUND
                     continue
                 
-                sha1 = None if entry.sha1 is None else hashlib.sha1()
+                sha1 = None if raw_entry.sha1 is None else hashlib.sha1()
                 size = 0
 
-                entry.dst.parent.mkdir(parents=True, exist_ok=True)
                 with entry.dst.open("wb") as dst_fp:
 
                     while True:
@@ -365,19 +505,10 @@ def _download_thread(
                             sha1.update(buffer_view)
                         dst_fp.write(buffer_view)
 
-                        # Update speed calculation at given interval.
-                        now = time.monotonic()
-                        speed_elapsed_time = now - speed_last_time
-                        if speed_elapsed_time > speed_update_interval:
-                            speed_elapsed_size = speed_current_size - speed_last_size
-                            current_speed = speed_elapsed_size / speed_elapsed_time
-                            speed = speed_smoothing * current_speed + (1 - speed_smoothing) * speed
-                            speed_last_time = now
-                            speed_last_size = speed_current_size
-
                         # Filled the whole buffer, send a progress update because we'll 
                         # likely need another reading.
                         if partial_progress and read_len == buffer_cap:
+                            update_speed()
                             result_queue.put(DownloadResultProgress(
                                 thread_id,
                                 entry,
@@ -385,21 +516,24 @@ def _download_thread(
                                 speed,
                                 False
                             ))
-            
-                # If the entry should be executable, only those that can read would be
-                # able to execute it.
-                if entry.executable:
-                    prev_mode = entry.dst.stat().st_mode
-                    entry.dst.chmod(prev_mode | ((prev_mode & 0o444) >> 2))
+                    
+                    # If the entry should be executable, only those that can read would
+                    # be able to execute it. This is done on the still opened file, 
+                    # and is only relevant on systems with POSIX permissions.
+                    if entry.executable and hasattr(os, "fchmod"):
+                        dst_fd = dst_fp.fileno()
+                        prev_mode = os.fstat(dst_fd).st_mode
+                        os.fchmod(dst_fd, prev_mode | ((prev_mode & 0o444) >> 2))
 
                 # Checking size and sha1 if relevant, if no error we send the full 
                 # progress.
                 if entry.size is not None and size != entry.size:
                     last_error = DownloadResultError.INVALID_SIZE
-                elif sha1 is not None and sha1.hexdigest() != entry.sha1:
+                elif sha1 is not None and sha1.digest() != raw_entry.sha1:
                     last_error = DownloadResultError.INVALID_SHA1
                 else:
                     
+                    update_speed()
                     result_queue.put(DownloadResultProgress(
                         thread_id,
                         entry,
@@ -425,5 +559,5 @@ def _download_thread(
             # then we should remove the file.
             try:
                 entry.dst.unlink()
-            except FileNotFoundError:
-                pass  # Not a problem if the file isn't present.
+            except (FileNotFoundError, NotADirectoryError):
+                pass  # Not a problem if the file or its directory isn't present.
@@ -5,9 +5,10 @@ from urllib.error import HTTPError, URLError
 from http.client import HTTPResponse
 import urllib.request
 import urllib.parse
-import json
 import ssl
 
+from .util import json_loads
+
 from typing import Optional, Any, cast
 
 
@@ -31,7 +32,7 @@ class HttpResponse:
     def json(self) -> Any:
         """Parse the data as JSON. This may raise a JSONDecodeError.
         """
-        return json.loads(self.data)
+        return json_loads(self.data)
     
     def text(self) -> str:
         """Parse the data as UTF-8 text.
@@ -80,17 +81,40 @@ def http_request(method: str, url: str, *,
     if content_type is not None:
         headers["Content-Type"] = content_type
 
-    try:
-        import certifi
-        ctx = ssl.create_default_context(cafile=certifi.where())
-    except ImportError:
-        ctx = None
-
     try:
         req = urllib.request.Request(url, data, headers, method=method)
-        res: HTTPResponse = urllib.request.urlopen(req, context=ctx)
+        res: HTTPResponse = _get_opener().open(req)
         return HttpResponse(res)
     except HTTPError as error:
         raise HttpError(HttpResponse(cast(HTTPResponse, error)), method, url, error)
     except URLError as error:
         raise HttpError(HttpResponse(None), method, url, error)
+
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_opener: Optional[urllib.request.OpenerDirector] = None
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """Get the SSL context shared by all HTTPS connections of the launcher, it is only 
+    created once because loading the certificates is costly. Certifi is used if 
+    installed.
+    """
+    global _ssl_context
+    if _ssl_context is None:
+        try:
+            import certifi
+            _ssl_context = ssl.create_default_context(cafile=certifi.where())
+        except ImportError:
+            _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def _get_opener() -> urllib.request.OpenerDirector:
+    """Internal function to get the URL opener used by `http_request`, it is built once
+    with the shared SSL context.
+    """
+    global _opener
+    if _opener is None:
+        _opener = urllib.request.build_opener(urllib.request.HTTPSHandler(context=get_ssl_context()))
+    return _opener
@@ -9,18 +9,20 @@ from json import JSONDecodeError
 from pathlib import Path
 from uuid import uuid4
 import platform
+import hashlib
 import shutil
-import json
+import sys
 import re
 import os
 
 from .download import DownloadList, DownloadEntry, DownloadResultProgress, DownloadResultError
-from .util import jvm_bin_filename, merge_dict, calc_input_sha1, LibrarySpecifier
+from .util import jvm_bin_filename, merge_dict, json_loads, json_dumps, \
+    write_file_atomic, LibrarySpecifier
 from .auth import AuthSession, OfflineAuthSession
 from .http import http_request, HttpError
 from . import LAUNCHER_NAME, LAUNCHER_VERSION
 
-from typing import Optional, Iterator, Dict, List, Tuple, Any, Callable, Set
+from typing import Optional, Iterator, Dict, List, Tuple, Any, Callable, Set, Union
 
 
 RESOURCES_URL = "https://resources.download.minecraft.net/"
@@ -132,8 +134,7 @@ class VersionHandle:
         """This function write the metadata file of the version with the internal data.
         """
         self.dir.mkdir(parents=True, exist_ok=True)
-        with self.metadata_file().open("wt") as fp:
-            json.dump(self.metadata, fp)
+        write_file_atomic(self.metadata_file(), json_dumps(self.metadata))
 
     def read_metadata_file(self) -> bool:
         """This function reads the metadata file and updates the internal data if found.
@@ -141,8 +142,8 @@ class VersionHandle:
         :return: True if the data was actually updated from the file.
         """
         try:
-            with self.metadata_file().open("rt") as fp:
-                self.metadata = json.load(fp)
+            with self.metadata_file().open("rb") as fp:
+                self.metadata = json_loads(fp.read())
             return True
         except (OSError, JSONDecodeError):
             return False
@@ -390,7 +391,12 @@ class Version:
         :return: True if the given version is valid and its metadata was properly loaded.
         """
 
-        if not version.read_metadata_file():
+        # Read the file only once, the same data is used for the sha1 check below.
+        try:
+            with version.metadata_file().open("rb") as version_meta_fp:
+                version_meta_data = version_meta_fp.read()
+            version.metadata = json_loads(version_meta_data)
+        except (OSError, JSONDecodeError):
             return False
 
         try:
@@ -404,12 +410,7 @@ class Version:
         else:
             expected_sha1 = version_super_meta.get("sha1")
             if expected_sha1 is not None:
-                try:
-                    with version.metadata_file().open("rb") as version_meta_fp:
-                        current_sha1 = calc_input_sha1(version_meta_fp)
-                        return expected_sha1 == current_sha1
-                except OSError:
-                    return False
+                return expected_sha1 == hashlib.sha1(version_meta_data).hexdigest()
             return True
 
     def _fetch_version(self, version: VersionHandle, watcher: Watcher) -> None:
@@ -433,8 +434,7 @@ class Version:
         
         # If successful, write the raw data directly to the file.
         version.dir.mkdir(parents=True, exist_ok=True)
-        with version.metadata_file().open("wb") as fp:
-            fp.write(res.data)
+        write_file_atomic(version.metadata_file(), res.data)
 
     def _resolve_features(self, watcher: Watcher) -> None:
         """Step resolving the version's features, whose are a mapping of string to 
@@ -508,7 +508,7 @@ class Version:
 
         try:
             with assets_index_file.open("rb") as assets_index_fp:
-                assets_index = json.load(assets_index_fp)
+                assets_index = json_loads(assets_index_fp.read())
         except (OSError, JSONDecodeError):
 
             # If for some reason we can't read an assets index, try downloading it.
@@ -516,10 +516,12 @@ class Version:
             if not isinstance(assets_index_url, str):
                 raise ValueError("metadata: /assetIndex/url must be a string")
             
-            assets_index = http_request("GET", assets_index_url, accept="application/json").json()
+            res = http_request("GET", assets_index_url, accept="application/json")
+            assets_index = res.json()
+
+            # The raw data is written directly, no need to serialize it again.
             assets_indexes_dir.mkdir(parents=True, exist_ok=True)
-            with assets_index_file.open("wt") as assets_index_fp:
-                json.dump(assets_index, assets_index_fp)
+            write_file_atomic(assets_index_file, res.data)
 
         assets_objects_dir = context.assets_dir / "objects"
         assets_resources = assets_index.get("map_to_resources", False)  # For version <= 13w23b
@@ -534,6 +536,11 @@ class Version:
         if not isinstance(assets_objects, dict):
             raise ValueError("assets index: /objects must be an object")
 
+        # Entries are added at once to speed up verification of existing files.
+        assets_entries: List[DownloadEntry] = []
+        # Objects are spread in at most 256 directories, avoid joining paths twice.
+        assets_objects_dirs: Dict[str, Path] = {}
+
         for asset_id, asset_obj in assets_objects.items():
 
             if not isinstance(asset_obj, dict):
@@ -548,12 +555,17 @@ class Version:
                 raise ValueError(f"assets index: /objects/{asset_id}/size must be an integer")
 
             asset_hash_prefix = asset_hash[:2]
-            asset_file = assets_objects_dir.joinpath(asset_hash_prefix, asset_hash)
+            asset_dir = assets_objects_dirs.get(asset_hash_prefix)
+            if asset_dir is None:
+                asset_dir = assets_objects_dirs[asset_hash_prefix] = assets_objects_dir / asset_hash_prefix
+            asset_file = asset_dir / asset_hash
 
             asset_url = f"{RESOURCES_URL}{asset_hash_prefix}/{asset_hash}"
             self._assets[asset_id] = asset_file
-            self._dl.add(DownloadEntry(asset_url, asset_file, size=asset_size, sha1=asset_hash, name=asset_id), verify=True)
+            assets_entries.append(DownloadEntry(asset_url, asset_file, size=asset_size, sha1=asset_hash, name=asset_id))
         
+        self._dl.add_many(assets_entries, verify=True)
+
         self._assets_index_version = assets_index_version
         self._assets_virtual_dir = context.assets_dir.joinpath("virtual", assets_index_version) if assets_virtual else None
         self._assets_resources_dir = context.work_dir / "resources" if assets_resources else None
@@ -592,7 +604,7 @@ class Version:
 
         # Recursion order is important for libraries resolving, root libraries should
         # be placed first.
-        for version in self._hierarchy[0].recurse():
+        for version in self._hierarchy:
 
             metadata_libraries = version.metadata.get("libraries")
             if metadata_libraries is None:
@@ -853,8 +865,8 @@ class Version:
         jvm_manifest_file = self.context.jvm_dir / f"{jvm_version_type}.json"
 
         try:
-            with jvm_manifest_file.open("rt") as jvm_manifest_fp:
-                jvm_manifest = json.load(jvm_manifest_fp)
+            with jvm_manifest_file.open("rb") as jvm_manifest_fp:
+                jvm_manifest = json_loads(jvm_manifest_fp.read())
         except (OSError, JSONDecodeError):
 
             all_jvm_meta = http_request("GET", JVM_META_URL, accept="application/json").json()
@@ -885,8 +897,7 @@ class Version:
             jvm_manifest["version"] = jvm_meta[0].get("version", {}).get("name")
 
             jvm_manifest_file.parent.mkdir(parents=True, exist_ok=True)
-            with jvm_manifest_file.open("wt") as jvm_manifest_fp:
-                json.dump(jvm_manifest, jvm_manifest_fp)
+            write_file_atomic(jvm_manifest_file, json_dumps(jvm_manifest))
         
         # Special case for macOS because of weird directory structure.
         if minecraft_os == "osx":
@@ -901,6 +912,8 @@ class Version:
         if not isinstance(jvm_files, dict):
             raise ValueError("jvm manifest: /files must be an object")
 
+        jvm_entries: List[DownloadEntry] = []
+
         for jvm_file_path_prefix, jvm_file in jvm_files.items():
             if jvm_file.get("type") == "file":
 
@@ -909,8 +922,10 @@ class Version:
                 jvm_download_entry = parse_download_entry(jvm_download_raw, jvm_file_path, f"jvm manifest: /files/{jvm_file_path_prefix}/downloads/raw")
                 jvm_download_entry.executable = jvm_file.get("executable", False)
 
-                self._dl.add(jvm_download_entry, verify=True)
+                jvm_entries.append(jvm_download_entry)
         
+        self._dl.add_many(jvm_entries, verify=True)
+
         watcher.handle(JvmLoadedEvent(self._jvm_version, JvmLoadedEvent.MOJANG))
 
     def _resolve_builtin_jvm(self, watcher: Watcher, reason: str, major_version: Optional[int]) -> None:
@@ -957,8 +972,10 @@ class Version:
         if not entries_count:
             return
         
-        # Note: do not create more thread than available entries.
-        threads_count = min(entries_count, (os.cpu_count() or 1) * 4)
+        # Note: do not create more thread than available entries. Downloading is not
+        # CPU bound, so the threads count depends on the number of hosts to limit the
+        # concurrent connections to each of them.
+        threads_count = min(entries_count, max(8, self._dl.count_hosts() * 8), 64)
         errors = []
 
         watcher.handle(DownloadStartEvent(threads_count, entries_count, self._dl.size))
@@ -1057,7 +1074,7 @@ class Version:
             class_path.append(str(self._jar_path.absolute()))
    
         # Get the last version in the parent's tree, we use it to apply legacy fixes.
-        ancestor_id = list(self._hierarchy[0].recurse())[-1].id
+        ancestor_id = self._hierarchy[-1].id
 
         # Legacy proxy aims to fix things like skins on old versions.
         # This is applicable to all alpha/beta and 1.0:1.5
@@ -1419,11 +1436,11 @@ class VersionManifest:
             # time that will be used for requesting the manifest, only if needed.
             if self.cache_file is not None:
                 try:
-                    with self.cache_file.open("rt") as cache_fp:
-                        cache_data = json.load(cache_fp)
+                    with self.cache_file.open("rb") as cache_fp:
+                        cache_data = json_loads(cache_fp.read())
                     if "last_modified" in cache_data:
                         headers["If-Modified-Since"] = cache_data["last_modified"]
-                except (OSError, json.JSONDecodeError):
+                except (OSError, JSONDecodeError):
                     pass
             
             try:
@@ -1439,8 +1456,7 @@ class VersionManifest:
 
                 if self.cache_file is not None:
                     self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-                    with self.cache_file.open("wt") as cache_fp:
-                        json.dump(self.data, cache_fp)
+                    write_file_atomic(self.cache_file, json_dumps(self.data))
 
             except HttpError as error:
                 # Checking for 0, which means network error, in such case we want to 
@@ -1739,6 +1755,10 @@ def interpret_rule(rules: Any, features: Dict[str, bool], path: str, *,
         if not isinstance(rule, dict):
             raise ValueError(f"{path}/{i} must be an object")
 
+        action = rule.get("action")
+        if allowed and action == "allow" and all_features is None:
+            continue  # This rule cannot change the result, no need to check conditions.
+
         rule_os = rule.get("os")
         if rule_os is not None and not interpret_rule_os(rule_os, f"{path}/{i}/os"):
             continue
@@ -1759,7 +1779,6 @@ def interpret_rule(rules: Any, features: Dict[str, bool], path: str, *,
             if not feat_valid:
                 continue
         
-        action = rule.get("action")
         if action == "disallow":
             return False    # Early return because of disallow.
         elif action == "allow":
@@ -1782,11 +1801,31 @@ def interpret_rule_os(rule_os: Any, path: str) -> bool:
         os_arch = rule_os.get("arch")
         if os_arch is None or os_arch == minecraft_arch:
             os_version = rule_os.get("version")
-            if os_version is None or re.search(os_version, platform.version()) is not None:
+            if os_version is None:
+                return True
+            # Patterns are few and repeated across libraries, compile them only once.
+            os_version_pattern = _os_version_patterns.get(os_version)
+            if os_version_pattern is None:
+                os_version_pattern = _os_version_patterns[os_version] = compile_os_version(os_version)
+            if isinstance(os_version_pattern, str):
+                if minecraft_os_version.startswith(os_version_pattern):
+                    return True
+            elif os_version_pattern.search(minecraft_os_version) is not None:
                 return True
     return False
 
 
+def compile_os_version(os_version: str) -> Union[str, re.Pattern]:
+    """Internal function to compile the version regex of an OS rule. Most of these 
+    patterns are just anchored literal prefixes, such as `^10\\.`, in such case the
+    prefix string is returned to be checked with `str.startswith`, otherwise the regex
+    is compiled.
+    """
+    if _literal_prefix_pattern.fullmatch(os_version) is not None:
+        return os_version[1:].replace("\\.", ".")
+    return re.compile(os_version)
+
+
 def interpret_args(args: Any, features: Dict[str, bool], dst: List[str], path: str, *, 
     all_features: Optional[Set[str]] = None
 ) -> None:
@@ -1867,11 +1906,9 @@ minecraft_arch = {
     "armv6l": "arm32",
 }.get(platform.machine().lower())
 
-# Stores the bits length of pointers on the current system.
-minecraft_arch_bits = {
-    "64bit": 64,
-    "32bit": 32
-}.get(platform.architecture()[0])
+# Stores the bits length of pointers on the current system. This is not using
+# platform.architecture() because it spawns a 'file' process on most systems.
+minecraft_arch_bits = 64 if sys.maxsize > 2**32 else 32
 
 # Name of the OS has used by Mojang for officially distributed JVMs.
 minecraft_jvm_os = None if minecraft_arch is None else {
@@ -1880,6 +1917,13 @@ minecraft_jvm_os = None if minecraft_arch is None else {
     "Windows": {"x86": "windows-x86", "x86_64": "windows-x64"}
 }.get(platform.system(), {}).get(minecraft_arch)
 
+# Version of the OS, matched against the version regex of rules.
+minecraft_os_version = platform.version()
+
+# Compiled version regex of rules, by pattern, see `compile_os_version`.
+_os_version_patterns: Dict[str, Union[str, re.Pattern]] = {}
+_literal_prefix_pattern = re.compile(r"\^(?:[A-Za-z0-9 _-]|\\\.)*")
+
 # JVM arguments used if no arguments are specified.
 legacy_jvm_args = [
     {
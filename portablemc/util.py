@@ -3,14 +3,75 @@ compatibility is not guaranteed unless explicitly specified.
 """
 
 from datetime import datetime
+from pathlib import Path
 import platform
+import json
+import os
 
-from typing import Optional
+from typing import Optional, Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 jvm_bin_filename = "javaw.exe" if platform.system() == "Windows" else "java"
 
 
+def json_loads(data: bytes) -> Any:
+    """Parse JSON data, orjson is used if installed because it's much faster than the
+    standard library on large documents such as assets indexes.
+
+    :raises JSONDecodeError: If the data is not valid JSON, orjson's error is a 
+    subclass of the standard one.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def json_dumps(obj: Any) -> bytes:
+    """Serialize an object to JSON bytes, orjson is used if installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode()
+
+
+def write_file_atomic(path: Path, data: bytes) -> None:
+    """Write the given data to a file atomically, the data is first written to a 
+    temporary sibling file which then replaces the destination file. This ensures that
+    an interrupted write never leaves a partially written file.
+    """
+    # The temporary file is unique so that concurrent writers don't collide, it is 
+    # created with the same default permissions as open() would, depending on umask.
+    tmp_flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp_path = path.with_name(f"{path.name}.{os.urandom(4).hex()}.tmp")
+        try:
+            tmp_fd = os.open(tmp_path, tmp_flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(tmp_fd, "wb") as fp:
+            # Keep the permissions of the file being replaced, if any.
+            if hasattr(os, "fchmod"):
+                try:
+                    os.fchmod(fp.fileno(), os.stat(path).st_mode & 0o7777)
+                except FileNotFoundError:
+                    pass
+            fp.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
 def merge_dict(dst: dict, other: dict) -> None:
     """Merge a dictionary into a destination one.
 
@@ -39,10 +100,13 @@ def calc_input_sha1(input_stream, *, buffer_len: int = 8192) -> str:
     """Internal function to calculate the sha1 of an input stream.
 
     :param input_stream: The input stream that supports `readinto`.
-    :param buffer_len: Internal buffer length, defaults to 8192
+    :param buffer_len: Internal buffer length, defaults to 8192, ignored on Python 3.11+
+    where `hashlib.file_digest` is used.
     :return: The sha1 string.
     """
     import hashlib
+    if hasattr(hashlib, "file_digest"):
+        return hashlib.file_digest(input_stream, "sha1").hexdigest()
     h = hashlib.sha1()
     b = bytearray(buffer_len)
     mv = memoryview(b)
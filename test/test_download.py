@@ -1,3 +1,6 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from threading import Thread
 from pathlib import Path
 from os import path
 import pytest
@@ -86,3 +89,178 @@ def test_download(tmp_path):
     assert not path.isfile(wrong_size.dst)
     assert not path.isfile(not_found.dst)
     assert not path.isfile(conn_err.dst)
+
+
+def test_download_list_verify(tmp_path):
+
+    existing_dir = tmp_path / "existing"
+    existing_dir.mkdir()
+    existing_dir.joinpath("same_size").write_bytes(b"hello")
+    existing_dir.joinpath("wrong_size").write_bytes(b"hello")
+    existing_dir.joinpath("no_size").write_bytes(b"hello")
+    existing_dir.joinpath("dir").mkdir()
+
+    def entries():
+        return [
+            DownloadEntry("https://foo.bar/same_size", existing_dir / "same_size", size=5),
+            DownloadEntry("https://foo.bar/wrong_size", existing_dir / "wrong_size", size=6),
+            DownloadEntry("https://foo.bar/no_size", existing_dir / "no_size"),
+            DownloadEntry("https://foo.bar/dir", existing_dir / "dir"),
+            DownloadEntry("https://foo.bar/missing", existing_dir / "missing"),
+            DownloadEntry("https://foo.bar/missing_dir", tmp_path / "missing" / "missing_dir"),
+        ]
+
+    dl = DownloadList()
+    for entry in entries():
+        dl.add(entry, verify=True)
+    
+    dl_many = DownloadList()
+    dl_many.add_many(entries(), verify=True)
+
+    assert dl.count == dl_many.count == 4
+    assert dl.size == dl_many.size == 6
+    assert [e.entry for e in dl.entries] == [e.entry for e in dl_many.entries]
+
+    dl_many.clear()
+    dl_many.add_many(entries())
+    assert dl_many.count == 6
+
+
+def test_download_list_url():
+
+    dl = DownloadList()
+    dl.add(DownloadEntry("https://resources.download.minecraft.net/bd/bdf48ef6b5d0d23bbb02e17d04865216179f510a", Path("foo")))
+    dl.add(DownloadEntry("http://libraries.minecraft.net", Path("foo")))
+    dl.add(DownloadEntry("https://maven.foo.bar:8443/baz", Path("foo")))
+    dl.add(DownloadEntry("http://user@[::1]:8080/baz", Path("foo")))
+
+    assert [(e.https, e.host, e.port) for e in dl.entries] == [
+        (True, "resources.download.minecraft.net", None),
+        (False, "libraries.minecraft.net", None),
+        (True, "maven.foo.bar", 8443),
+        (False, "::1", 8080),
+    ]
+
+    dl.add(DownloadEntry("https://resources.download.minecraft.net/bd/bdf48ef6b5d0d23bbb02e17d04865216179f510b", Path("foo")))
+    assert dl.count_hosts() == 4
+
+
+class _LocalHandler(BaseHTTPRequestHandler):
+    """Serve files from the server's 'files' mapping, by path, or redirect as given by
+    its 'redirects' mapping.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        req_path = urlparse(self.path).path
+        redirect = self.server.redirects.get(req_path)
+        if redirect is not None:
+            self.send_response(302)
+            self.send_header("Location", redirect)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        data = self.server.files.get(req_path)
+        if data is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def local_server():
+    """Factory fixture starting local HTTP servers, returning their base URL.
+    """
+
+    servers = []
+
+    def start(files, redirects = None) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _LocalHandler)
+        server.files = files
+        server.redirects = redirects or {}
+        Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+    
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_ports(tmp_path, local_server):
+
+    one_url = local_server({"/a": b"one"})
+    two_url = local_server({"/b": b"two"})
+
+    one = DownloadEntry(f"{one_url}/a", tmp_path / "a", size=3)
+    two = DownloadEntry(f"{two_url}/b", tmp_path / "b", size=3)
+
+    dl = DownloadList()
+    dl.add(one)
+    dl.add(two)
+
+    results = [result for _, result in dl.download(1)]
+    assert not any(isinstance(result, DownloadResultError) for result in results)
+    assert one.dst.read_bytes() == b"one"
+    assert two.dst.read_bytes() == b"two"
+
+
+def test_download_redirect(tmp_path, local_server):
+
+    target_url = local_server({"/file": b"hello"})
+    redirect_url = local_server({}, {
+        "/first": "/second",
+        "/second": f"{target_url}/file",
+        "/loop": "/loop",
+    })
+
+    chained = DownloadEntry(f"{redirect_url}/first", tmp_path / "chained", size=5)
+    loop = DownloadEntry(f"{redirect_url}/loop", tmp_path / "loop")
+
+    dl = DownloadList()
+    dl.add(chained)
+    dl.add(loop)
+
+    results = {result.entry: result for _, result in dl.download(1)}
+    assert not isinstance(results[chained], DownloadResultError)
+    assert chained.dst.read_bytes() == b"hello"
+    assert isinstance(results[loop], DownloadResultError)
+    assert results[loop].code == DownloadResultError.NOT_FOUND
+
+    # Redirections must not modify the entries of the list.
+    redirect_port = int(redirect_url.rsplit(":", 1)[1])
+    assert sorted((e.url, e.port) for e in dl.entries) == [
+        (chained.url, redirect_port),
+        (loop.url, redirect_port),
+    ]
+
+
+def test_download_dir_error(tmp_path, local_server):
+
+    url = local_server({"/a": b"one", "/b": b"two"})
+
+    # A regular file where a directory is expected.
+    tmp_path.joinpath("file").write_bytes(b"")
+    invalid = DownloadEntry(f"{url}/a", tmp_path / "file" / "a")
+    valid = DownloadEntry(f"{url}/b", tmp_path / "dir" / "b")
+
+    dl = DownloadList()
+    dl.add(invalid)
+    dl.add(valid)
+
+    results = {result.entry: result for _, result in dl.download(1)}
+    assert isinstance(results[invalid], DownloadResultError)
+    assert results[invalid].code == DownloadResultError.CONNECTION
+    assert isinstance(results[invalid].origin, OSError)
+    assert valid.dst.read_bytes() == b"two"
@@ -1,4 +1,5 @@
 import pytest
+import os
 
 
 def test_sha1():
@@ -88,3 +89,63 @@ def test_library_specifier():
     assert spec.extension == "txt"
     assert str(spec) == "foo.bar:baz:0.1.0:classifier@txt"
     assert spec.file_path() == "foo/bar/baz/0.1.0/baz-0.1.0-classifier.txt"
+
+
+def test_json():
+
+    from portablemc.util import json_loads, json_dumps
+    from json import JSONDecodeError
+
+    obj = {"id": "1.19", "libraries": [{"name": "a:b:1"}], "size": 1234, "ok": True}
+    assert json_loads(json_dumps(obj)) == obj
+    assert json_loads(b'{"a": [1, 2.5, null]}') == {"a": [1, 2.5, None]}
+
+    with pytest.raises(JSONDecodeError):
+        json_loads(b"{invalid")
+
+
+def test_write_file_atomic(tmp_path):
+
+    from portablemc.util import write_file_atomic
+
+    file = tmp_path / "file.json"
+    write_file_atomic(file, b"hello")
+    assert file.read_bytes() == b"hello"
+    write_file_atomic(file, b"world!")
+    assert file.read_bytes() == b"world!"
+    assert [p.name for p in tmp_path.iterdir()] == ["file.json"]
+
+    if os.name != "nt":
+
+        # New files get the default permissions, as with open().
+        umask = os.umask(0)
+        os.umask(umask)
+        new_file = tmp_path / "new.json"
+        write_file_atomic(new_file, b"hello")
+        assert new_file.stat().st_mode & 0o777 == 0o666 & ~umask
+
+        # Existing files keep their permissions.
+        file.chmod(0o640)
+        write_file_atomic(file, b"hello")
+        assert file.stat().st_mode & 0o777 == 0o640
+
+
+def test_compile_os_version():
+
+    from portablemc.standard import compile_os_version
+
+    assert compile_os_version("^10\\.") == "10."
+    assert compile_os_version("^6\\.1\\.") == "6.1."
+    assert compile_os_version("^10\\..*").search("10.0.19041") is not None
+    assert compile_os_version("SMP").search("#1 SMP PREEMPT_DYNAMIC") is not None
+
+
+def test_write_file_atomic_error(tmp_path):
+
+    from portablemc.util import write_file_atomic
+
+    # Replacing a directory fails, the temporary file must not be left behind.
+    (tmp_path / "dir").mkdir()
+    with pytest.raises(OSError):
+        write_file_atomic(tmp_path / "dir", b"hello")
+    assert [p.name for p in tmp_path.iterdir()] == ["dir"]